@@ -32,9 +32,7 @@ def handler(event, context):
 
     # retrieve HiScores for `player`
     logger.info(f"Getting HiScores for {player}")
-    payload = rs_api.process_hiscores_response(
-        rs_api.request_hiscores(player=player, timeout=45.0)
-    )
+    payload = rs_api.get_hiscores(player=player, timeout=45.0)
 
     # write result to `table`
     logger.info(
@@ -1,10 +1,16 @@
 """Module for interacting with OSRS APIs."""
+import copy
+import functools
 import logging
-from datetime import datetime, timedelta
-from typing import List
-from urllib.parse import urlparse
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import AnyStr, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from .constants import (
     HISCORE_RESPONSE_ACTIVITY_COLS,
@@ -24,7 +30,30 @@ __all__ = [
     "InvalidSchemaError",
     "request_hiscores",
     "sanitize_hiscores_stats",
+    "sanitize_hiscores_stats_bytes",
     "process_hiscores_response",
+    "get_hiscores",
+]
+
+
+_SESSION: Optional[requests.Session] = None
+
+_HISCORES_CACHE_TTL_SECS = 60.0
+_HISCORES_CACHE_MAXSIZE = 256
+# player -> (monotonic time cached, processed payload)
+_HISCORES_CACHE: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+
+_SKILL_RANK, _SKILL_LEVEL, _SKILL_XP = HISCORES_RESPONSE_SKILL_COLS
+_ACTIVITY_RANK, _ACTIVITY_COUNT = HISCORE_RESPONSE_ACTIVITY_COLS
+_SKILL_WIDTH = len(HISCORES_RESPONSE_SKILL_COLS)
+_ACTIVITY_WIDTH = len(HISCORE_RESPONSE_ACTIVITY_COLS)
+# (row name, offset of its first value in the flattened response)
+_SKILL_OFFSETS: List[Tuple[str, int]] = [
+    (skill, i * _SKILL_WIDTH) for i, skill in enumerate(HISCORES_RESPONSE_SKILLS)
+]
+_ACTIVITY_OFFSETS: List[Tuple[str, int]] = [
+    (activity, len(HISCORES_RESPONSE_SKILLS) * _SKILL_WIDTH + i * _ACTIVITY_WIDTH)
+    for i, activity in enumerate(HISCORES_RESPONSE_ACTIVITIES)
 ]
 
 
@@ -36,30 +65,64 @@ class HiscoresDownError(Exception):
     """Indicates an error connecting with the OSRS HiScores API."""
 
 
-def get_hiscores_api(player: str) -> str:
-    if "iron" in player.lower():
-        return HISCORES_IRONMAN_API
-    return HISCORES_API
+def _get_session() -> requests.Session:
+    """Lazily build the pooled session shared by all hiscores requests.
 
-
-def _parse_hiscores_response_line(line: str, schema: List[str]) -> dict:
-    """Parse a single line of a hiscores API response."""
-    split_line = line.split(",")
-    if len(schema) != len(split_line):
-        raise InvalidSchemaError(
-            f"Schema '{schema}' is invalid for line '{line}': must be same length."
+    Both hiscores endpoints live on the same host, so a single keep-alive pool
+    serves regular and ironman lookups across warm Lambda invocations.
+    """
+    global _SESSION
+    if _SESSION is None:
+        session = requests.Session()
+        session.mount(
+            "https://",
+            HTTPAdapter(
+                pool_connections=2,
+                pool_maxsize=20,
+                # only retry gateway errors; a read timeout is surfaced at once
+                max_retries=Retry(
+                    total=3,
+                    read=False,
+                    backoff_factor=0.2,
+                    status_forcelist=(502, 503, 504),
+                    raise_on_status=False,
+                ),
+            ),
         )
-    return dict(zip(schema, map(int, split_line)))
+        _SESSION = session
+    return _SESSION
 
 
-def _parse_skill_line(line: str) -> dict:
-    """Parse a CSV skill line from a hiscores response."""
-    return _parse_hiscores_response_line(line, HISCORES_RESPONSE_SKILL_COLS)
+def get_hiscores_api(player: str) -> str:
+    if "iron" in player.lower():
+        return HISCORES_IRONMAN_API
+    return HISCORES_API
 
 
-def _parse_activity_line(line: str) -> dict:
-    """Parse a CSV activity line from a hiscores response."""
-    return _parse_hiscores_response_line(line, HISCORE_RESPONSE_ACTIVITY_COLS)
+@functools.lru_cache(maxsize=1024)
+def _get_hiscores_url(player: str) -> str:
+    """Build the encoded hiscores URL for a player once and reuse it."""
+    return (
+        requests.Request("GET", get_hiscores_api(player), params={"player": player})
+        .prepare()
+        .url
+    )
+
+
+def _parse_hiscores_response_values(
+    body: AnyStr, num_skill_lines: int, newline: AnyStr, comma: AnyStr
+) -> List[int]:
+    """Parse every value of a hiscores API response into one flat list of ints."""
+    lines = body.split(newline)
+    # validate the width of every line so a short line can't be offset by a long one
+    for i, line in enumerate(lines):
+        width = _SKILL_WIDTH if i < num_skill_lines else _ACTIVITY_WIDTH
+        if line.count(comma) != width - 1:
+            kind = "skill" if i < num_skill_lines else "activity"
+            raise InvalidSchemaError(
+                f"Expected {kind} line {i} to contain {width} values: {line!r}"
+            )
+    return list(map(int, comma.join(lines).split(comma)))
 
 
 def request_hiscores(
@@ -67,24 +130,22 @@ def request_hiscores(
 ) -> requests.models.Response:
     """Call hiscore_oldscool API to request stats for a given player."""
     try:
-        response = requests.get(
-            get_hiscores_api(player=player),
-            params={"player": player},
-            timeout=timeout,
-            **kwargs,
+        response = _get_session().get(
+            _get_hiscores_url(player), timeout=timeout, **kwargs
         )
-    except requests.exceptions.ReadTimeout as e:
+    except requests.exceptions.Timeout as e:
         raise HiscoresDownError(
             f"Timed out calling Hiscores API after {timeout} seconds."
         ) from e
 
-    if response.elapsed > timedelta(seconds=warn_secs):
+    if response.elapsed.total_seconds() > warn_secs:
         logger.warning(
             f"Longer than expected response time from Hiscores API: "
             f"{response.elapsed.seconds}s."
         )
 
-    if "<!doctype html>" in response.text:
+    # valid responses start with a digit, so only the head of the body is checked
+    if response.content[:32].lstrip().lower().startswith(b"<!doctype html>"):
         raise HiscoresDownError(f"Hiscores API returned HTML response: {response.text}")
 
     if response.status_code != 200:
@@ -95,62 +156,104 @@ def request_hiscores(
     return response
 
 
-def sanitize_hiscores_stats(text: str) -> dict:
-    """Sanitize hiscore_oldscool API result text.
-
-    API documentation:
-    https://runescape.wiki/w/Application_programming_interface#Hiscores_Lite_2
-
-    """
-
-    # split string by line
-    lines = text.strip().split("\n")
+def _sanitize_hiscores_stats(body: AnyStr, newline: AnyStr, comma: AnyStr) -> dict:
+    """Sanitize a hiscore_oldscool API result held as either `str` or `bytes`."""
+    body = body.strip()
+    num_lines = body.count(newline) + 1
 
-    if len(lines) != len(HISCORES_RESPONSE_SKILLS) + len(HISCORES_RESPONSE_ACTIVITIES):
+    if num_lines != len(HISCORES_RESPONSE_SKILLS) + len(HISCORES_RESPONSE_ACTIVITIES):
         logger.warning(
             "HiScores response contains unexpected number of lines. Have the set of "
             "skills or activities returned by the HiScores API changed recently? "
             "Check https://runescape.wiki/w/Application_programming_interface#Old_School_Hiscores."  # noqa: E501
         )
 
-    # skills are returned first
-    skill_lines = lines[: len(HISCORES_RESPONSE_SKILLS)]
-    # parse and label elements
+    # skills are returned first, activities second
+    num_skill_lines = min(num_lines, len(HISCORES_RESPONSE_SKILLS))
+    num_activity_lines = num_lines - num_skill_lines
     try:
-        skill_dict = dict(
-            zip(HISCORES_RESPONSE_SKILLS, map(_parse_skill_line, skill_lines))
-        )
+        values = _parse_hiscores_response_values(body, num_skill_lines, newline, comma)
     except InvalidSchemaError as e:
-        raise ValueError("Expected skill line of API result is malformatted.") from e
-
-    # activities are returned second
-    activity_lines = lines[len(HISCORES_RESPONSE_SKILLS) :]
-    # parse and label elements
-    try:
-        activity_dict = dict(
-            zip(
-                HISCORES_RESPONSE_ACTIVITIES,
-                map(_parse_activity_line, activity_lines),
-            )
-        )
-    except InvalidSchemaError as e:
-        raise ValueError("Expected activity line of API result is malformatted.") from e
+        raise ValueError("Expected lines of API result are malformatted.") from e
+
+    # label elements
+    skill_dict = {
+        skill: {
+            _SKILL_RANK: values[i],
+            _SKILL_LEVEL: values[i + 1],
+            _SKILL_XP: values[i + 2],
+        }
+        for skill, i in _SKILL_OFFSETS[:num_skill_lines]
+    }
+    activity_dict = {
+        activity: {_ACTIVITY_RANK: values[i], _ACTIVITY_COUNT: values[i + 1]}
+        for activity, i in _ACTIVITY_OFFSETS[:num_activity_lines]
+    }
 
     # return all information
     return dict(skills=skill_dict, activities=activity_dict)
 
 
+def sanitize_hiscores_stats(text: str) -> dict:
+    """Sanitize hiscore_oldscool API result text.
+
+    API documentation:
+    https://runescape.wiki/w/Application_programming_interface#Hiscores_Lite_2
+
+    """
+    return _sanitize_hiscores_stats(text, "\n", ",")
+
+
+def sanitize_hiscores_stats_bytes(content: bytes) -> dict:
+    """Sanitize hiscore_oldscool API result bytes without decoding them to text.
+
+    The response body is plain ASCII digits, commas and newlines, and `int`
+    accepts `bytes` directly, so the Unicode decode of `response.text` can be
+    skipped entirely.
+
+    """
+    return _sanitize_hiscores_stats(content, b"\n", b",")
+
+
 def process_hiscores_response(response: requests.models.Response) -> dict:
     """Read hiscores API response into human-readable format."""
-    # parse and label API response text
-    result: dict = sanitize_hiscores_stats(response.text)
+    # parse and label API response body
+    result: dict = sanitize_hiscores_stats_bytes(response.content)
 
     # Add player name
-    query = urlparse(response.request.url).query.split("=")
-    if len(query) != 2 or query[0] != "player":
-        raise ValueError(f"Received invalid query in API result: {'='.join(query)}")
-    result["player"] = query[1].replace("+", " ")
+    query = urlparse(response.request.url).query
+    try:
+        result["player"] = parse_qs(query)["player"][0]
+    except KeyError as e:
+        raise ValueError(f"Received invalid query in API result: {query}") from e
 
     # Add timestamp
-    result["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # equivalent to strftime("%Y-%m-%d %H:%M:%S"), without the format parsing
+    now = datetime.now()
+    result["timestamp"] = (
+        f"{now.year:04d}-{now.month:02d}-{now.day:02d} "
+        f"{now.hour:02d}:{now.minute:02d}:{now.second:02d}"
+    )
     return result
+
+
+def get_hiscores(player: str, **kwargs) -> dict:
+    """Request and process hiscores for a player, reusing recent results.
+
+    Payloads are cached per player for `_HISCORES_CACHE_TTL_SECS` within a warm
+    Lambda container, so a redelivered message for the same player neither calls
+    the API again nor produces a second timestamped row. Callers always receive
+    a copy, so mutating a result never alters the cached payload.
+    """
+    now = time.monotonic()
+    cached = _HISCORES_CACHE.get(player)
+    if cached is not None and now - cached[0] < _HISCORES_CACHE_TTL_SECS:
+        logger.info(f"Reusing HiScores for {player} cached {now - cached[0]:.1f}s ago")
+        return copy.deepcopy(cached[1])
+
+    payload = process_hiscores_response(request_hiscores(player, **kwargs))
+    _HISCORES_CACHE[player] = (now, payload)
+    _HISCORES_CACHE.move_to_end(player)
+    while len(_HISCORES_CACHE) > _HISCORES_CACHE_MAXSIZE:
+        _HISCORES_CACHE.popitem(last=False)
+    return copy.deepcopy(payload)
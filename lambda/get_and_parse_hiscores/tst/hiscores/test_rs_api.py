@@ -5,10 +5,11 @@ from unittest import mock
 import get_and_parse_hiscores.lib.hiscores.rs_api as rs_api
 import pytest
 import requests
+import urllib3
 
 
-class MockRequestsGet(object):
-    """Mock for `requests` module."""
+class MockSessionSend(object):
+    """Mock for `requests.Session.send`."""
 
     def __init__(self, text, status_code, elapsed, reason):
         self._text = text
@@ -16,15 +17,14 @@ class MockRequestsGet(object):
         self._elapsed = datetime.timedelta(seconds=elapsed)
         self._reason = reason
 
-    def __call__(self, api, params, *args, **kwargs):
+    def __call__(self, request, *args, **kwargs):
         response = requests.Response()
         response._content = self._text.encode()
         response.status_code = self._status_code
         response.elapsed = self._elapsed
         response.reason = self._reason
 
-        response.request = requests.Request()
-        response.request.url = api + "?player=" + params["player"]
+        response.request = request
 
         return response
 
@@ -265,22 +265,24 @@ def successful_parsed_response(player_name):
     ],
 )
 @mock.patch(
-    f"{rs_api.__name__}.requests.get",
-    side_effect=MockRequestsGet(
+    f"{rs_api.__name__}.requests.Session.send",
+    side_effect=MockSessionSend(
         text=successful_response_text(),
         status_code=200,
         elapsed=5,
         reason="OK",
     ),
 )
-def test_get_parse_hiscores_valid(mock_get, player, api):
+def test_get_parse_hiscores_valid(mock_send, player, api):
     response = rs_api.request_hiscores(player)
-    mock_get.assert_called_once_with(api, params=dict(player=player), timeout=mock.ANY)
+    mock_send.assert_called_once()
+    assert mock_send.call_args[0][0].url == f"{api}?player={player}"
 
     payload = rs_api.process_hiscores_response(response)
     timestamp = payload.pop("timestamp")
     assert payload == successful_parsed_response(player_name=player)
     assert timestamp is not None
+    assert datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
 
 
 def test_process_hiscores_response_invalid_query(mocker, player_name):
@@ -289,11 +291,21 @@ def test_process_hiscores_response_invalid_query(mocker, player_name):
     mock_response.request = mock_request
     mock_request.url = rs_api.HISCORES_API + "?username=" + player_name
 
-    mocker.patch(f"{rs_api.__name__}.sanitize_hiscores_stats")
+    mocker.patch(f"{rs_api.__name__}.sanitize_hiscores_stats_bytes")
     with pytest.raises(ValueError):
         rs_api.process_hiscores_response(mock_response)
 
 
+def test_process_hiscores_response_encoded_query(mocker):
+    mock_response = mocker.Mock()
+    mock_request = mocker.Mock()
+    mock_response.request = mock_request
+    mock_request.url = rs_api.HISCORES_API + "?player=Elder+Plinius&unused=1"
+
+    mocker.patch(f"{rs_api.__name__}.sanitize_hiscores_stats_bytes", return_value={})
+    assert rs_api.process_hiscores_response(mock_response)["player"] == "Elder Plinius"
+
+
 def test_sanitize_hiscores_stats_invalid_skill_line():
     invalid_skill_line_schema = successful_response_text().replace(
         "417625,1775,51739960", "-1,-1"
@@ -302,6 +314,38 @@ def test_sanitize_hiscores_stats_invalid_skill_line():
         rs_api.sanitize_hiscores_stats(invalid_skill_line_schema)
 
 
+def test_sanitize_hiscores_stats_swapped_line_widths():
+    swapped_line_widths = (
+        successful_response_text()
+        .replace("417625,1775,51739960", "417625,1775")
+        .replace("420501,42", "420501,42,1")
+    )
+    with pytest.raises(ValueError):
+        rs_api.sanitize_hiscores_stats(swapped_line_widths)
+    with pytest.raises(ValueError):
+        rs_api.sanitize_hiscores_stats_bytes(swapped_line_widths.encode())
+
+
+@pytest.mark.parametrize(
+    "original,replacement",
+    [
+        (
+            "536659,85,3273304\n620289,80,2054713",
+            "536659,85,3273304,7\n620289,80",
+        ),
+        ("420501,42\n1099732,1", "420501,42,1\n1099732"),
+    ],
+)
+def test_sanitize_hiscores_stats_offsetting_lines_in_block(original, replacement):
+    text = successful_response_text()
+    assert original in text
+    offsetting_lines = text.replace(original, replacement)
+    with pytest.raises(ValueError):
+        rs_api.sanitize_hiscores_stats(offsetting_lines)
+    with pytest.raises(ValueError):
+        rs_api.sanitize_hiscores_stats_bytes(offsetting_lines.encode())
+
+
 def test_sanitize_hiscores_stats_invalid_activities_line():
     invalid_activity_line_schema = successful_response_text().replace(
         "-1,-1", "417625,1775,51739960"
@@ -311,40 +355,102 @@ def test_sanitize_hiscores_stats_invalid_activities_line():
 
 
 @mock.patch(
-    f"{rs_api.__name__}.requests.get",
+    f"{rs_api.__name__}.requests.Session.send",
     side_effect=requests.exceptions.ReadTimeout,
 )
-def test_request_hiscores_read_timeout(mock_get, player_name):
+def test_request_hiscores_read_timeout(mock_send, player_name):
     with pytest.raises(rs_api.HiscoresDownError):
         rs_api.request_hiscores(player_name)
-    mock_get.assert_called_once()
+    mock_send.assert_called_once()
+
+
+def test_request_hiscores_read_timeout_through_adapter(mocker, player_name):
+    mock_make_request = mocker.patch.object(
+        urllib3.connectionpool.HTTPConnectionPool,
+        "_make_request",
+        side_effect=urllib3.exceptions.ReadTimeoutError(
+            None, rs_api.HISCORES_API, "Read timed out."
+        ),
+    )
+    with pytest.raises(rs_api.HiscoresDownError):
+        rs_api.request_hiscores(player_name, timeout=1.0)
+    mock_make_request.assert_called_once()
 
 
 @mock.patch(
-    f"{rs_api.__name__}.requests.get",
-    side_effect=MockRequestsGet(
+    f"{rs_api.__name__}.requests.Session.send",
+    side_effect=MockSessionSend(
         text="<!doctype html> <body> API DOWN </body>",
         status_code=500,
         elapsed=1,
         reason="Internal Server Error",
     ),
 )
-def test_request_hiscores_down(mock_get, player_name):
+def test_request_hiscores_down(mock_send, player_name):
     with pytest.raises(rs_api.HiscoresDownError):
         rs_api.request_hiscores(player_name)
-    mock_get.assert_called_once()
+    mock_send.assert_called_once()
 
 
 @mock.patch(
-    f"{rs_api.__name__}.requests.get",
-    side_effect=MockRequestsGet(
+    f"{rs_api.__name__}.requests.Session.send",
+    side_effect=MockSessionSend(
         text="Resource not found",
         status_code=404,
         elapsed=1,
         reason="Resource not found",
     ),
 )
-def test_request_hiscores_error(mock_get, player_name):
+def test_request_hiscores_error(mock_send, player_name):
     with pytest.raises(ValueError):
         rs_api.request_hiscores(player_name)
-    mock_get.assert_called_once()
+    mock_send.assert_called_once()
+
+
+def test_get_session_reused():
+    session = rs_api._get_session()
+    assert rs_api._get_session() is session
+    assert session.get_adapter(rs_api.HISCORES_API).max_retries.total == 3
+
+
+def test_sanitize_hiscores_stats_skills_only(player_name):
+    skills_only = "\n".join(successful_response_text().split("\n")[:24])
+    result = rs_api.sanitize_hiscores_stats(skills_only)
+    assert result["skills"] == successful_parsed_response(player_name)["skills"]
+    assert result["activities"] == {}
+
+
+def test_sanitize_hiscores_stats_bytes_matches_text():
+    text = successful_response_text()
+    assert rs_api.sanitize_hiscores_stats_bytes(
+        text.encode()
+    ) == rs_api.sanitize_hiscores_stats(text)
+
+
+def test_get_hiscores_url_cached():
+    url = rs_api._get_hiscores_url("Elder Plinius")
+    assert rs_api._get_hiscores_url("Elder Plinius") is url
+    assert url == f"{rs_api.HISCORES_API}?player=Elder+Plinius"
+
+
+def test_get_hiscores_cached(mocker, player_name):
+    mocker.patch.dict(rs_api._HISCORES_CACHE, clear=True)
+    mock_request = mocker.patch(f"{rs_api.__name__}.request_hiscores")
+    mock_process = mocker.patch(
+        f"{rs_api.__name__}.process_hiscores_response",
+        side_effect=lambda response: {"player": player_name, "timestamp": "now"},
+    )
+    mock_time = mocker.patch(f"{rs_api.__name__}.time.monotonic", return_value=0.0)
+
+    payload = rs_api.get_hiscores(player_name, timeout=1.0)
+    payload.pop("timestamp")
+    assert rs_api.get_hiscores(player_name) == {
+        "player": player_name,
+        "timestamp": "now",
+    }
+    mock_request.assert_called_once_with(player_name, timeout=1.0)
+
+    mock_time.return_value = rs_api._HISCORES_CACHE_TTL_SECS
+    rs_api.get_hiscores(player_name)
+    assert mock_request.call_count == 2
+    assert mock_process.call_count == 2
@@ -2,9 +2,12 @@
 
 import argparse
 import logging
+import orjson
 import requests
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from requests.adapters import HTTPAdapter
 
 TIMESTAMP_FMT = "%Y-%m-%d %H:%M:%S"
 DATE_FMT = "%Y-%m-%d"
@@ -13,96 +16,137 @@ MONTH_FMT = "%Y-%m"
 LEGACY = "legacy"
 V0 = "v0"
 
+MAX_WORKERS = 16
 
-def main(args):
-    logger = logging.getLogger(__name__)
-    logging.basicConfig()
-    logger.setLevel(logging.DEBUG)
+POLL_INITIAL_SECS = 0.2
+POLL_MAX_INTERVAL_SECS = 2.0
+POLL_TIMEOUT_SECS = 10.0
 
-    logger.info("Triggering save event...")
-    before = datetime.utcnow()
-    trigger_response = requests.post(args.log_api)
-    players = trigger_response.json()
-    logger.info(f"Triggered save for players {players}")
 
-    logger.info("Sleeping 10 seconds...")
-    time.sleep(10.0)
-    after = datetime.utcnow()
+def _build_queries(args, player, before, after):
+    """Build the (description, url, params) queries to validate for `player`."""
+    queries = []
 
-    for player in players:
-        start_time = datetime.strftime(before, TIMESTAMP_FMT)
-        end_time = datetime.strftime(after, TIMESTAMP_FMT)
-        logger.info(
-            f"Querying granular data for {player}, "
-            f"startTime={start_time}, endTime={end_time}"
-        )
-        query_response = requests.get(
+    start_time = datetime.strftime(before, TIMESTAMP_FMT)
+    end_time = datetime.strftime(after, TIMESTAMP_FMT)
+    queries.append(
+        (
+            f"Granular query for player {player}",
             args.query_api + V0,
-            params=dict(
-                player=player,
-                startTime=start_time,
-                endTime=end_time,
-            ),
-        )
-        granular_result = query_response.json()
-        if query_response.status_code != 200 or not granular_result:
-            logger.error(f"Received unexpected response: {granular_result}")
-            raise AssertionError(f"Granular query for player {player} invalid.")
-
-        start_time = datetime.strftime(before, DATE_FMT)
-        end_time = datetime.strftime(after, DATE_FMT)
-        logger.info(
-            f"Querying daily aggregated data for {player}, "
-            f"startTime={start_time}, endTime={end_time}"
+            dict(player=player, startTime=start_time, endTime=end_time),
         )
-        query_response = requests.get(
+    )
+
+    start_time = datetime.strftime(before, DATE_FMT)
+    end_time = datetime.strftime(after, DATE_FMT)
+    queries.append(
+        (
+            f"Daily aggregated query for player {player}",
             args.query_api + V0,
-            params=dict(
-                player=player,
-                startTime=start_time,
-                endTime=end_time,
-            ),
+            dict(player=player, startTime=start_time, endTime=end_time),
         )
-        daily_result = query_response.json()
-        if query_response.status_code != 200 or not daily_result:
-            logger.error(f"Received unexpected response: {daily_result}")
-            raise AssertionError(f"Daily aggregated query for player {player} invalid.")
-
-        for category in ["level", "rank", "experience"]:
-            sql = (
-                f"SELECT timestamp,Slayer,Farming FROM skills.{category} "
-                f"WHERE player='{player}' AND timestamp > '{start_time} 00:00:00' "
-                f"AND timestamp < '{end_time} 23:59:59' ORDER BY timestamp ASC"
+    )
+    for category in ["level", "rank", "experience"]:
+        sql = (
+            f"SELECT timestamp,Slayer,Farming FROM skills.{category} "
+            f"WHERE player='{player}' AND timestamp > '{start_time} 00:00:00' "
+            f"AND timestamp < '{end_time} 23:59:59' ORDER BY timestamp ASC"
+        )
+        queries.append(
+            (
+                f"Legacy {category} query for player {player}",
+                args.query_api + LEGACY,
+                dict(sql=sql),
             )
-            logger.info(f"Querying legacy API for sql={sql}")
-            query_response = requests.get(args.query_api + LEGACY, params=dict(sql=sql))
-            legacy_result = query_response.json()
-            if query_response.status_code != 200 or not legacy_result:
-                logger.error(f"Received unexpected response: {legacy_result}")
-                raise AssertionError(
-                    f"Daily aggregated query for player {player} invalid."
-                )
-
-        start_time = datetime.strftime(before, MONTH_FMT)
-        end_time = datetime.strftime(after, MONTH_FMT)
-        logger.info(
-            f"Querying monthly aggregated data for {player}, "
-            f"startTime={start_time}, endTime={end_time}"
         )
-        query_response = requests.get(
+
+    start_time = datetime.strftime(before, MONTH_FMT)
+    end_time = datetime.strftime(after, MONTH_FMT)
+    queries.append(
+        (
+            f"Monthly aggregated query for player {player}",
             args.query_api + V0,
-            params=dict(
-                player=player,
-                startTime=start_time,
-                endTime=end_time,
-            ),
+            dict(player=player, startTime=start_time, endTime=end_time),
         )
-        monthly_result = query_response.json()
-        if query_response.status_code != 200 or not monthly_result:
-            logger.error(f"Received unexpected response: {monthly_result}")
-            raise AssertionError(
-                f"Monthly aggregated query for player {player} invalid."
+    )
+    return queries
+
+
+def _has_data(session, url, params):
+    """Return whether a query succeeds with a non-empty result."""
+    query_response = session.get(url, params=params)
+    return query_response.status_code == 200 and bool(
+        orjson.loads(query_response.content)
+    )
+
+
+def _wait_for_save(session, args, players, before, logger):
+    """Poll with exponential backoff until every player's data is queryable.
+
+    Daily and monthly rows are written asynchronously by the aggregator from the
+    table's stream, so a player is ready only once its granular, daily and
+    monthly queries all return data.
+    """
+    pending = set(players)
+    delay = POLL_INITIAL_SECS
+    deadline = time.monotonic() + POLL_TIMEOUT_SECS
+    while pending:
+        time.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+        now = datetime.utcnow()
+        for player in sorted(pending):
+            if all(
+                _has_data(session, url, params)
+                for _, url, params in _build_queries(args, player, before, now)
+                if url == args.query_api + V0
+            ):
+                pending.discard(player)
+        if pending and time.monotonic() >= deadline:
+            logger.warning(
+                f"Timed out after {POLL_TIMEOUT_SECS} seconds waiting for {pending}."
             )
+            return
+        delay = min(delay * 2, POLL_MAX_INTERVAL_SECS)
+
+
+def main(args):
+    logger = logging.getLogger(__name__)
+    logging.basicConfig()
+    logger.setLevel(logging.DEBUG)
+
+    # size the pool for the most concurrent queries so sockets are reused
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=MAX_WORKERS))
+
+    logger.info("Triggering save event...")
+    before = datetime.utcnow()
+    trigger_response = session.post(args.log_api)
+    players = orjson.loads(trigger_response.content)
+    logger.info(f"Triggered save for players {players}")
+
+    logger.info(f"Waiting up to {POLL_TIMEOUT_SECS} seconds for saves to land...")
+    _wait_for_save(session, args, players, before, logger)
+    after = datetime.utcnow()
+
+    queries = [
+        query
+        for player in players
+        for query in _build_queries(args, player, before, after)
+    ]
+
+    def run_query(description, url, params):
+        logger.info(f"Running {description} with params={params}")
+        return session.get(url, params=params)
+
+    max_workers = max(1, min(MAX_WORKERS, 2 * len(players)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_query, *query): query[0] for query in queries}
+        for future in as_completed(futures):
+            description = futures[future]
+            query_response = future.result()
+            result = orjson.loads(query_response.content)
+            if query_response.status_code != 200 or not result:
+                logger.error(f"Received unexpected response: {result}")
+                raise AssertionError(f"{description} invalid.")
 
     logger.info("TESTS PASSED")
 